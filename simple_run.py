@@ -30,7 +30,8 @@ class SimpleVideoSystem:
         
         # 初始化组件（每个组件有自己的logger名称）
         self.monitor = SimpleVideoMonitor()
-        self.worker = SimpleVideoWorker()
+        # 共享监控器，监控发现的新视频会立即唤醒工作器
+        self.worker = SimpleVideoWorker(monitor=self.monitor)
         
         # 线程控制
         self.running = False
@@ -189,6 +190,7 @@ class SimpleVideoSystem:
         """停止系统"""
         self.logger.info("🛑 正在停止系统...")
         self.running = False
+        self.worker.stop()
         
         # 等待线程结束
         if self.monitor_thread and self.monitor_thread.is_alive():
@@ -33,15 +33,21 @@ fi
 echo "✅ 环境检查通过"
 echo ""
 
-# 显示选项
-echo "请选择运行模式："
-echo "1. 完整模式 (初始化+监控+处理)"
-echo "2. 仅处理新视频 (跳过初始化)"
-echo "3. 仅初始化队列"
-echo "4. 查看状态"
-echo ""
+# 运行模式可通过参数或环境变量指定，便于非交互环境（CI/容器）使用
+# 例如: bash simple_start.sh 2  或  SIMPLE_START_CHOICE=2 bash simple_start.sh
+choice="${1:-$SIMPLE_START_CHOICE}"
+
+if [ -z "$choice" ]; then
+    # 显示选项
+    echo "请选择运行模式："
+    echo "1. 完整模式 (初始化+监控+处理)"
+    echo "2. 仅处理新视频 (跳过初始化)"
+    echo "3. 仅初始化队列"
+    echo "4. 查看状态"
+    echo ""
 
-read -p "请输入选择 (1-4): " choice
+    read -p "请输入选择 (1-4): " choice
+fi
 
 case $choice in
     1)
@@ -50,15 +56,15 @@ case $choice in
         ;;
     2)
         echo "🚀 启动新视频处理模式..."
-        python3 simple_run.py --no-init
+        python3 simple_run.py --mode no-init
         ;;
     3)
         echo "🚀 初始化队列..."
-        python3 simple_run.py --init-only
+        python3 simple_run.py --mode init-only
         ;;
     4)
         echo "📊 查看系统状态..."
-        python3 simple_run.py --status
+        python3 simple_run.py --mode status
         ;;
     *)
         echo "❌ 无效选择"
@@ -5,6 +5,7 @@ import os
 import sys
 import time
 import shutil
+import subprocess
 from pathlib import Path
 from typing import List, Optional, Dict, Any
 from tqdm import tqdm
@@ -91,7 +92,6 @@ class ModelScopeManager:
                         "--include", repo_path      # 包含指定文件
                     ]
                     
-                    import subprocess
                     result = subprocess.run(download_cmd, capture_output=True, text=True, timeout=300)
                     
                     if result.returncode == 0 and os.path.exists(local_path):
@@ -206,7 +206,7 @@ class ModelScopeManager:
                         try:
                             size = os.path.getsize(file_path)
                             downloaded_size += size
-                        except:
+                        except OSError:
                             continue
             
             return {
@@ -229,7 +229,6 @@ class ModelScopeManager:
         ]:
             try:
                 # 尝试获取仓库信息
-                import subprocess
                 result = subprocess.run([
                     "modelscope", "download", 
                     repo_id, 
@@ -276,7 +275,6 @@ class ModelScopeManager:
                     "--local_dir", self.cache_dir # 本地目录
                 ]
                 
-                import subprocess
                 result = subprocess.run(download_cmd, capture_output=True, text=True, timeout=60)
                 
                 if result.returncode != 0:
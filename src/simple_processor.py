@@ -7,18 +7,46 @@
 
 import os
 import logging
+import functools
 import subprocess
 import tempfile
 import shutil
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 
 from config.config import Config
+from src.utils import low_priority_cmd
+
+
+# 输入端参数：同一时间只运行一个编码任务，解复用/复用和滤镜可使用全部CPU核心
+FFMPEG_INPUT_PARAMS = (
+    '-filter_threads', str(max(1, (os.cpu_count() or 2) // 2)),
+    '-thread_queue_size', '1024',  # 输入包队列，避免解复用阻塞
+)
+
+# 输出端 MKV+AV1 编码参数
+FFMPEG_AV1_PARAMS = (
+    '-threads', '0',      # 自动选择线程数
+    '-c:v', 'av1_nvenc',  # 使用NVIDIA硬件编码
+    '-preset', 'p4',      # 平衡质量和速度
+    '-rc', 'vbr',         # 可变比特率
+    '-cq', '28',          # 质量控制
+    '-b:v', '0',          # 让CQ控制比特率
+    '-maxrate', '10M',    # 最大比特率限制
+    '-bufsize', '20M',    # 缓冲区大小
+    '-c:a', 'copy',       # 音频直接复制
+    '-c:s', 'copy',       # 字幕直接复制
+    '-map', '0',          # 复制所有流
+    '-avoid_negative_ts', 'make_zero',
+)
 
 
 class SimpleVideoProcessor:
     """简化的视频处理器 - 只做格式转换"""
     
+    # 输出文件扩展名
+    _OUTPUT_EXT = ".mkv"
+    
     def __init__(self, logger=None):
         self.logger = logger or logging.getLogger(__name__)
         self.config = Config()
@@ -37,24 +65,17 @@ class SimpleVideoProcessor:
         try:
             self.logger.info(f"开始转换: {os.path.basename(input_path)}")
             
+            # 源视频已是AV1时无需重新编码
+            codec_name, format_name = self.probe_video(input_path)
+            if codec_name == 'av1':
+                if self._reuse_av1_source(input_path, output_path, format_name):
+                    return True
+                self.logger.warning(f"复用AV1源文件失败，改为重新编码: {os.path.basename(input_path)}")
+            
             # 构建FFmpeg命令
-            cmd = [
-                'ffmpeg',
-                '-i', input_path,
-                '-c:v', 'av1_nvenc',  # 使用NVIDIA硬件编码
-                '-preset', 'p4',      # 平衡质量和速度
-                '-rc', 'vbr',         # 可变比特率
-                '-cq', '28',          # 质量控制
-                '-b:v', '0',          # 让CQ控制比特率
-                '-maxrate', '10M',    # 最大比特率限制
-                '-bufsize', '20M',    # 缓冲区大小
-                '-c:a', 'copy',       # 音频直接复制
-                '-c:s', 'copy',       # 字幕直接复制
-                '-map', '0',          # 复制所有流
-                '-avoid_negative_ts', 'make_zero',
-                '-y',                 # 覆盖输出文件
-                output_path
-            ]
+            cmd = low_priority_cmd(
+                ['ffmpeg', *FFMPEG_INPUT_PARAMS, '-i', input_path, *FFMPEG_AV1_PARAMS, '-y', output_path]
+            )
             
             self.logger.info(f"FFmpeg命令: {' '.join(cmd)}")
             
@@ -91,7 +112,68 @@ class SimpleVideoProcessor:
             self.logger.error(f"转换异常: {e}")
             return False
     
-    def get_output_filename(self, input_filename: str) -> str:
+    def probe_video(self, input_path: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        读取视频元数据（不解码），返回第一个视频流的编码和容器格式
+        
+        Returns:
+            Tuple[Optional[str], Optional[str]]: (编码名, 容器格式名)，探测失败时为 (None, None)
+        """
+        cmd = [
+            'ffprobe', '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'stream=codec_name:format=format_name',
+            '-of', 'default=noprint_wrappers=1',
+            input_path
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            self.logger.warning(f"ffprobe探测失败: {e}")
+            return None, None
+        
+        if result.returncode != 0:
+            return None, None
+        
+        info = dict(line.split('=', 1) for line in result.stdout.splitlines() if '=' in line)
+        return info.get('codec_name'), info.get('format_name')
+    
+    def _reuse_av1_source(self, input_path: str, output_path: str, format_name: Optional[str]) -> bool:
+        """源视频已是AV1：MKV直接链接/复制，其他容器只做封装转换"""
+        try:
+            Path(output_path).unlink(missing_ok=True)
+            
+            if format_name and 'matroska' in format_name.split(','):
+                try:
+                    os.link(input_path, output_path)
+                except OSError:
+                    shutil.copyfile(input_path, output_path)
+                self.logger.info(f"源视频已是MKV+AV1，跳过编码: {os.path.basename(input_path)}")
+                return True
+            
+            cmd = low_priority_cmd([
+                'ffmpeg', '-v', 'error',
+                '-i', input_path,
+                '-map', '0',
+                '-c', 'copy',
+                '-f', 'matroska',
+                '-y', output_path
+            ])
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=3600)
+            if result.returncode == 0 and os.path.getsize(output_path) > 0:
+                self.logger.info(f"源视频已是AV1，仅转换为MKV封装: {os.path.basename(input_path)}")
+                return True
+            
+            self.logger.warning(f"封装转换失败: {result.stderr}")
+            return False
+            
+        except (OSError, subprocess.TimeoutExpired) as e:
+            self.logger.warning(f"封装转换异常: {e}")
+            return False
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def get_output_filename(input_filename: str) -> str:
         """
         根据输入文件名生成输出文件名
         保留原始前缀，只改变扩展名
@@ -104,7 +186,7 @@ class SimpleVideoProcessor:
         """
         # 移除原扩展名，添加.mkv
         base_name = os.path.splitext(input_filename)[0]
-        return f"{base_name}.mkv"
+        return base_name + SimpleVideoProcessor._OUTPUT_EXT
     
     def process_single_video(self, input_path: str, temp_dir: str) -> Optional[str]:
         """
@@ -138,8 +220,8 @@ class SimpleVideoProcessor:
         """清理临时文件"""
         for file_path in file_paths:
             try:
-                if file_path and os.path.exists(file_path):
-                    os.remove(file_path)
+                if file_path:
+                    Path(file_path).unlink(missing_ok=True)
                     self.logger.debug(f"清理临时文件: {file_path}")
-            except Exception as e:
+            except OSError as e:
                 self.logger.warning(f"清理文件失败 {file_path}: {e}") 
\ No newline at end of file
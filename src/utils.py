@@ -1,11 +1,19 @@
 import os
+import sys
 import shutil
 import logging
 import json
+import hashlib
 from pathlib import Path
 from typing import List, Dict, Any
 from datetime import datetime
 
+try:
+    import xxhash
+    _XXHASH_AVAILABLE = True
+except ImportError:
+    _XXHASH_AVAILABLE = False
+
 def setup_logging(name: str = 'animation_processor') -> logging.Logger:
     """设置日志系统"""
     # 使用提供的名称创建logger
@@ -31,6 +39,25 @@ def setup_logging(name: str = 'animation_processor') -> logging.Logger:
     
     return logger
 
+def _build_low_priority_prefix() -> List[str]:
+    """Linux 下用 nice/ionice 降低子进程的CPU和IO优先级，其他平台不做处理"""
+    if not sys.platform.startswith('linux'):
+        return []
+    
+    prefix = []
+    if shutil.which('nice'):
+        prefix += ['nice', '-n', '10']
+    if shutil.which('ionice'):
+        # best-effort 最低级别：让出磁盘但不会像 idle 类那样被完全饿死
+        prefix += ['ionice', '-c', '2', '-n', '7']
+    return prefix
+
+_LOW_PRIORITY_PREFIX = _build_low_priority_prefix()
+
+def low_priority_cmd(cmd: List[str]) -> List[str]:
+    """为外部命令加上低优先级前缀，避免编码和传输抢占调度线程及系统其他服务"""
+    return _LOW_PRIORITY_PREFIX + list(cmd)
+
 def get_disk_usage(path: str) -> Dict[str, float]:
     """获取磁盘使用情况（GB）"""
     stat = shutil.disk_usage(path)
@@ -66,7 +93,7 @@ def load_progress(progress_file: str) -> Dict[str, Any]:
     try:
         with open(progress_file, 'r', encoding='utf-8') as f:
             return json.load(f)
-    except:
+    except (OSError, ValueError):
         return {}
 
 def get_video_extensions() -> List[str]:
@@ -77,6 +104,28 @@ def is_video_file(file_path: str) -> bool:
     """检查文件是否为视频文件"""
     return Path(file_path).suffix.lower() in get_video_extensions()
 
+def fast_fingerprint(file_path: str, sample_size: int = 1 << 20) -> str:
+    """
+    计算文件的快速内容指纹：首尾各 sample_size 字节
+    
+    只取决于文件内容，不包含文件大小，仓库清单中的大小有误时也能识别出相同的文件；
+    优先使用 xxh3（需要安装 xxhash），否则使用 blake2b；
+    结果带有算法前缀，不同算法得到的指纹不会被误判为相同
+    """
+    size = os.path.getsize(file_path)
+    if _XXHASH_AVAILABLE:
+        algorithm, digest = 'xxh3', xxhash.xxh3_64()
+    else:
+        algorithm, digest = 'blake2b', hashlib.blake2b(digest_size=8)
+    
+    with open(file_path, 'rb') as f:
+        digest.update(f.read(sample_size))
+        if size > sample_size:
+            f.seek(max(sample_size, size - sample_size))
+            digest.update(f.read())
+    
+    return f"{algorithm}:{digest.hexdigest()}"
+
 def sanitize_filename(filename: str) -> str:
     """清理文件名，移除非法字符"""
     illegal_chars = ['<', '>', ':', '"', '/', '\\', '|', '?', '*']
@@ -6,13 +6,14 @@
 """
 
 import os
+import re
 import sys
 import time
 import json
-import hashlib
-import subprocess
-from datetime import datetime
-from typing import Dict, List, Set, Optional
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
 # 添加项目根目录到Python路径
@@ -22,10 +23,25 @@ sys.path.insert(0, project_root)
 from config.config import Config
 from src.utils import setup_logging
 
+try:
+    from modelscope.hub.api import HubApi
+    MODELSCOPE_AVAILABLE = True
+except ImportError:
+    MODELSCOPE_AVAILABLE = False
+
 
 class SimpleVideoMonitor:
     """简化的视频文件监控器"""
     
+    # 队列表中返回给调用方的字段
+    _QUEUE_COLUMNS = "path, size, mtime, added_time, status, priority"
+    
+    # 文件列表API的分页大小
+    _LIST_PAGE_SIZE = 150
+    
+    # 视频扩展名匹配（类加载时编译一次，所有实例共享，忽略大小写）
+    _VIDEO_RE = re.compile(r'\.(?:mp4|mkv|avi|mov|wmv|flv|webm|m4v|rmvb)$', re.IGNORECASE)
+    
     def __init__(self):
         self.config = Config()
         self.logger = setup_logging('video_monitor')
@@ -34,131 +50,146 @@ class SimpleVideoMonitor:
         self.repo_id = self.config.INPUT_REPO_ID
         self.token = self.config.MODELSCOPE_TOKEN
         
-        # 监控状态文件
+        # 进程内登录ModelScope，后续SDK调用复用登录凭证
+        self._api = self._login_modelscope()
+        
+        # 监控状态数据库（已处理记录 + 待处理队列）
+        self.db_file = "log/monitor.db"
+        # 旧版JSON状态文件，仅用于首次启动时迁移
         self.state_file = "log/monitor_state.json"
         self.queue_file = "log/video_queue.json"
         
-        # 已处理文件追踪
-        self.processed_videos: Set[str] = set()
-        self.video_queue: List[Dict] = []
+        # 打开数据库，多个线程共享同一连接，由锁串行化访问
+        self._lock = threading.RLock()
+        # 有新视频入队时唤醒等待中的消费者
+        self._queue_cond = threading.Condition(self._lock)
+        self._db = self._open_db()
+        self._migrate_legacy_json()
         
-        # 加载状态
-        self.load_state()
-        self.load_queue()
-        
-        # 视频扩展名
-        self.video_extensions = {'.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.rmvb'}
+        status = self.get_queue_status()
+        self.logger.info(f"加载状态: {status['processed_count']} 个已处理视频, "
+                         f"{status['queue_size']} 个待处理视频")
     
-    def load_state(self):
-        """加载监控状态"""
+    def _login_modelscope(self):
+        """登录ModelScope SDK，失败时返回None"""
+        if not MODELSCOPE_AVAILABLE:
+            self.logger.warning("未安装modelscope，仓库扫描将使用filelist.txt")
+            return None
+        
         try:
-            if os.path.exists(self.state_file):
-                with open(self.state_file, 'r', encoding='utf-8') as f:
-                    state = json.load(f)
-                    self.processed_videos = set(state.get('processed_videos', []))
-                    self.logger.info(f"加载状态: {len(self.processed_videos)} 个已处理视频")
+            api = HubApi()
+            api.login(self.token)
+            return api
         except Exception as e:
-            self.logger.warning(f"加载状态文件失败: {e}")
+            self.logger.warning(f"ModelScope SDK登录失败: {e}")
+            return None
     
-    def save_state(self):
-        """保存监控状态"""
-        try:
-            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
-            state = {
-                'processed_videos': list(self.processed_videos),
-                'last_update': datetime.now().isoformat()
-            }
-            with open(self.state_file, 'w', encoding='utf-8') as f:
-                json.dump(state, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            self.logger.error(f"保存状态文件失败: {e}")
+    def _open_db(self) -> sqlite3.Connection:
+        """打开状态数据库并确保表结构存在"""
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+        
+        # 自动提交模式，多步操作通过 _transaction() 显式开启事务
+        db = sqlite3.connect(self.db_file, timeout=30, isolation_level=None,
+                             check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS processed (
+                path TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                processed_time REAL NOT NULL,
+                size INTEGER,
+                fingerprint TEXT
+            );
+            CREATE TABLE IF NOT EXISTS queue (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime REAL,
+                added_time REAL NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                priority INTEGER NOT NULL DEFAULT 1
+            );
+            DROP INDEX IF EXISTS idx_queue_added_time;
+            CREATE INDEX IF NOT EXISTS idx_queue_status_added_time ON queue (status, added_time);
+        """)
+        
+        # 旧版数据库补充内容指纹相关字段
+        columns = {row["name"] for row in db.execute("PRAGMA table_info(processed)")}
+        for column, column_type in (("size", "INTEGER"), ("fingerprint", "TEXT")):
+            if column not in columns:
+                db.execute(f"ALTER TABLE processed ADD COLUMN {column} {column_type}")
+        
+        return db
+    
+    @contextmanager
+    def _transaction(self):
+        """在锁保护下执行一个写事务，异常时回滚"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
     
-    def load_queue(self) -> List[Dict]:
-        """加载视频队列"""
+    def _migrate_legacy_json(self):
+        """数据库为空时，从旧版JSON状态文件导入已处理记录和队列"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT EXISTS(SELECT 1 FROM processed) OR EXISTS(SELECT 1 FROM queue)"
+            ).fetchone()
+        if row[0]:
+            return
+        
+        processed_videos = []
+        video_queue = []
         try:
+            if os.path.exists(self.state_file):
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    processed_videos = json.load(f).get('processed_videos', [])
             if os.path.exists(self.queue_file):
                 with open(self.queue_file, 'r', encoding='utf-8') as f:
-                    self.video_queue = json.load(f)
-                    self.logger.info(f"加载队列: {len(self.video_queue)} 个待处理视频")
-        except Exception as e:
-            self.logger.warning(f"加载队列文件失败: {e}")
-            self.video_queue = []
-    
-    def save_queue(self):
-        """保存视频队列"""
-        try:
-            os.makedirs(os.path.dirname(self.queue_file), exist_ok=True)
-            with open(self.queue_file, 'w', encoding='utf-8') as f:
-                json.dump(self.video_queue, f, ensure_ascii=False, indent=2)
+                    video_queue = json.load(f)
         except Exception as e:
-            self.logger.error(f"保存队列文件失败: {e}")
+            self.logger.warning(f"读取旧版状态文件失败: {e}")
+            return
+        
+        if not processed_videos and not video_queue:
+            return
+        
+        now = time.time()
+        with self._transaction() as db:
+            db.executemany(
+                "INSERT OR IGNORE INTO processed (path, status, processed_time) VALUES (?, 'done', ?)",
+                [(path, now) for path in processed_videos]
+            )
+            db.executemany(
+                "INSERT OR IGNORE INTO queue (path, size, mtime, added_time, status, priority) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(item["path"], item.get("size", 0), item.get("mtime", now),
+                  item.get("added_time", now), item.get("status", "pending"),
+                  item.get("priority", 1)) for item in video_queue]
+            )
+        
+        self.logger.info(f"已从JSON状态文件迁移: {len(processed_videos)} 个已处理视频, "
+                         f"{len(video_queue)} 个待处理视频")
     
-    def get_all_videos_from_repo(self) -> List[Dict]:
-        """获取仓库中所有视频文件信息"""
+    def get_all_videos_from_repo(self) -> Optional[List[Dict]]:
+        """获取仓库中所有视频文件信息，获取仓库文件清单失败时返回None（本次检查跳过）"""
         try:
             self.logger.info("获取仓库中的所有视频文件...")
             
-            cache_dir = "/tmp/simple_monitor_cache"
-            
-            # 清理旧缓存
-            if os.path.exists(cache_dir):
-                import shutil
-                shutil.rmtree(cache_dir)
-            
-            # 使用正确的ModelScope CLI下载命令格式
-            # 1. 先尝试下载所有视频文件  
-            result = subprocess.run([
-                "modelscope", "download",
-                self.repo_id,                   # repo_id (位置参数)
-                "--repo-type", "dataset",       # 指定为数据集仓库
-                "--local_dir", cache_dir,       # 本地目录
-                "--include", "**/*.mp4",        # 包含所有视频格式
-                "--include", "**/*.mkv", 
-                "--include", "**/*.rmvb",
-                "--include", "**/*.avi",
-                "--include", "**/*.mov",
-                "--token", self.token           # 明确指定token
-            ], capture_output=True, text=True, timeout=600)
-            
-            if result.returncode != 0:
-                self.logger.warning(f"包含模式下载失败，尝试完整下载: {result.stderr}")
-                # 如果包含模式失败，尝试完整下载
-                result = subprocess.run([
-                    "modelscope", "download",
-                    self.repo_id,               # repo_id (位置参数)
-                    "--repo-type", "dataset",   # 指定为数据集仓库
-                    "--local_dir", cache_dir,   # 本地目录
-                    "--token", self.token       # 明确指定token
-                ], capture_output=True, text=True, timeout=600)
-            
-            if result.returncode != 0:
-                self.logger.error(f"下载仓库失败: {result.stderr}")
-                return self._get_expected_videos()
-            
-            # 解析视频文件
-            video_files = []
+            if not MODELSCOPE_AVAILABLE:
+                self.logger.warning("未安装modelscope，无法从仓库获取视频列表")
+                return self._get_videos_from_filelist()
             
-            for root, dirs, files in os.walk(cache_dir):
-                for file in files:
-                    if any(file.lower().endswith(ext) for ext in self.video_extensions):
-                        file_path = os.path.join(root, file)
-                        rel_path = os.path.relpath(file_path, cache_dir)
-                        
-                        # 清理路径
-                        clean_path = rel_path.replace('\\', '/')  # Windows路径转换
-                        
-                        if clean_path:
-                            try:
-                                stat = os.stat(file_path)
-                                video_info = {
-                                    "path": clean_path,
-                                    "size": stat.st_size,
-                                    "mtime": stat.st_mtime,
-                                    "status": "real"  # 标记为真实文件
-                                }
-                                video_files.append(video_info)
-                            except OSError:
-                                continue
+            # 只需要路径和大小，通过文件列表API获取，无需下载视频内容；
+            # 获取失败时跳过本次检查，而不是下载整个仓库来扫描
+            video_files = self._list_repo_files_fast()
+            if video_files is None:
+                return None
             
             self.logger.info(f"发现 {len(video_files)} 个视频文件")
             
@@ -172,6 +203,58 @@ class SimpleVideoMonitor:
             self.logger.error(f"获取视频文件失败: {e}")
             return self._get_videos_from_filelist()
     
+    def _list_repo_files_fast(self) -> Optional[List[Dict]]:
+        """根据仓库文件清单构建视频信息列表，获取清单失败时返回None"""
+        repo_files = self._list_repo_files()
+        if repo_files is None:
+            return None
+        
+        current_time = time.time()
+        return [
+            {
+                "path": f['Path'],
+                "size": f.get('Size'),  # 清单中缺少大小时为None，不参与变化判断
+                "mtime": current_time,
+                "status": "real"  # 标记为真实文件
+            }
+            for f in repo_files
+            if self._VIDEO_RE.search(f['Path'])
+        ]
+    
+    def _list_repo_files(self) -> Optional[List[Dict]]:
+        """通过文件列表API分页获取仓库中的所有文件元数据，失败时返回None"""
+        # 启动时登录失败的，每次检查时重试
+        if self._api is None:
+            self._api = self._login_modelscope()
+            if self._api is None:
+                return None
+        
+        namespace, dataset_name = self.repo_id.split('/', 1)
+        repo_files = []
+        page_number = 1
+        
+        try:
+            while True:
+                resp = self._api.list_repo_tree(
+                    dataset_name=dataset_name,
+                    namespace=namespace,
+                    revision='master',
+                    root_path='/',
+                    recursive=True,
+                    page_number=page_number,
+                    page_size=self._LIST_PAGE_SIZE
+                )
+                files = resp['Data']['Files'] or []
+                repo_files.extend(f for f in files if f.get('Type') != 'tree')
+                
+                if len(files) < self._LIST_PAGE_SIZE:
+                    return repo_files
+                page_number += 1
+                
+        except Exception as e:
+            self.logger.warning(f"获取仓库文件清单失败: {e}")
+            return None
+    
     def _get_videos_from_filelist(self) -> List[Dict]:
         """从filelist.txt获取视频列表（最终备用方案）"""
         try:
@@ -183,21 +266,23 @@ class SimpleVideoMonitor:
                 with open("filelist.txt", 'r', encoding='utf-8') as f:
                     for line in f:
                         line = line.strip()
-                        if line and any(line.lower().endswith(ext) for ext in self.video_extensions):
-                            # 提取路径信息
-                            # /volume1/db/5_video/archive/暗芝居 第1季/暗芝居 第1季 - 0009.mp4
-                            parts = line.split('/')
-                            if len(parts) >= 3:
-                                series_name = parts[-2]  # 暗芝居 第1季
-                                filename = parts[-1]     # 暗芝居 第1季 - 0009.mp4
-                                
-                                video_info = {
-                                    "path": f"{series_name}/{filename}",
-                                    "size": 100000000,  # 假设100MB
-                                    "mtime": current_time,
-                                    "status": "from_filelist"
-                                }
-                                videos.append(video_info)
+                        if not self._VIDEO_RE.search(line):
+                            continue
+                        
+                        # 提取路径信息
+                        # /volume1/db/5_video/archive/暗芝居 第1季/暗芝居 第1季 - 0009.mp4
+                        dir_part, _, filename = line.rpartition('/')  # 暗芝居 第1季 - 0009.mp4
+                        if '/' not in dir_part:
+                            continue
+                        series_name = dir_part.rpartition('/')[2]     # 暗芝居 第1季
+                        
+                        video_info = {
+                            "path": f"{series_name}/{filename}",
+                            "size": 100000000,  # 假设100MB
+                            "mtime": current_time,
+                            "status": "from_filelist"
+                        }
+                        videos.append(video_info)
                 
                 self.logger.info(f"从filelist.txt构造了 {len(videos)} 个视频")
                 return videos
@@ -242,78 +327,121 @@ class SimpleVideoMonitor:
         self.logger.info(f"使用预期视频列表: {len(expected_videos)} 个视频")
         return expected_videos
     
-    def add_video_to_queue(self, video_info: Dict):
-        """添加视频到处理队列"""
+    def add_video_to_queue(self, video_info: Dict) -> bool:
+        """添加视频到处理队列，返回是否为新加入的视频"""
         video_path = video_info["path"]
+        # 只有仓库列表给出的是真实大小，文件列表/预期列表中的大小是估计值
+        listed_size = video_info["size"] if video_info.get("status") == "real" else None
+        replaced = False
         
-        # 检查是否已处理
-        if video_path in self.processed_videos:
-            return
-        
-        # 检查是否已在队列中
-        for item in self.video_queue:
-            if item["path"] == video_path:
-                return
-        
-        # 添加到队列
-        queue_item = {
-            "path": video_path,
-            "size": video_info["size"],
-            "mtime": video_info["mtime"],
-            "added_time": time.time(),
-            "status": "pending",
-            "priority": 1  # 所有视频优先级相同
-        }
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size FROM processed WHERE path = ?", (video_path,)
+            ).fetchone()
+            if row is not None:
+                # 已处理的视频只有在仓库中的文件大小发生变化（被替换）时才重新处理
+                if listed_size is None or row[0] is None or row[0] == listed_size:
+                    return False
+                replaced = True
+            
+            # 已在队列中的视频会被忽略
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO queue (path, size, mtime, added_time, status, priority) "
+                "VALUES (?, ?, ?, ?, 'pending', 1)",  # 所有视频优先级相同
+                (video_path, video_info["size"], video_info["mtime"], time.time())
+            )
+            if cursor.rowcount != 1:
+                return False
+            # 在事务中调用时，被唤醒的消费者要等事务提交释放锁后才能读取
+            self._queue_cond.notify_all()
         
-        self.video_queue.append(queue_item)
-        self.logger.info(f"添加到队列: {video_path} ({video_info['size'] // 1024 // 1024} MB)")
+        if replaced:
+            self.logger.info(f"🔁 仓库中的文件已更新 ({row[0]} -> {listed_size} 字节)，重新加入队列: {video_path}")
+        else:
+            self.logger.info(f"添加到队列: {video_path} ({(video_info['size'] or 0) // 1024 // 1024} MB)")
+        return True
+    
+    def get_processed_fingerprint(self, video_path: str) -> Optional[str]:
+        """获取已成功处理的视频记录的源文件内容指纹，没有记录时返回None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fingerprint FROM processed WHERE path = ? AND status = 'done'",
+                (video_path,)
+            ).fetchone()
+        return row[0] if row else None
     
-    def mark_video_processed(self, video_path: str):
-        """标记视频为已处理"""
-        self.processed_videos.add(video_path)
+    def _mark_video(self, video_path: str, status: str, size: Optional[int] = None,
+                    fingerprint: Optional[str] = None) -> int:
+        """记录视频的最终状态并从队列中移除，返回移除的队列项数"""
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO processed (path, status, processed_time, size, fingerprint) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (video_path, status, time.time(), size, fingerprint)
+            )
+            return db.execute("DELETE FROM queue WHERE path = ?", (video_path,)).rowcount
+    
+    def mark_video_processed(self, video_path: str, size: Optional[int] = None,
+                             fingerprint: Optional[str] = None):
+        """
+        标记视频为已处理
         
+        Args:
+            video_path: 仓库中的视频路径
+            size: 仓库文件清单中的源文件大小，用于识别仓库中被替换的同名文件
+            fingerprint: 源文件内容指纹
+        """
         # 确保从队列中移除（防护性代码）
-        original_length = len(self.video_queue)
-        self.video_queue = [item for item in self.video_queue if item["path"] != video_path]
-        removed = original_length - len(self.video_queue)
-        
-        self.save_state()
+        removed = self._mark_video(video_path, "done", size, fingerprint)
         if removed > 0:
-            self.save_queue()
             self.logger.debug(f"从队列中移除了 {removed} 个重复项: {video_path}")
         
         self.logger.info(f"标记为已处理: {video_path}")
     
     def mark_video_failed(self, video_path: str):
         """标记视频处理失败，添加到已处理列表避免重复尝试"""
-        self.processed_videos.add(video_path)
+        self._mark_video(video_path, "failed")
+        self.logger.warning(f"标记为失败: {video_path}")
+    
+    def mark_batch(self, marks: List[Tuple[str, str, Optional[int], Optional[str]]]):
+        """
+        在一个事务中批量记录视频的最终状态
         
-        # 确保从队列中移除
-        original_length = len(self.video_queue)
-        self.video_queue = [item for item in self.video_queue if item["path"] != video_path]
-        removed = original_length - len(self.video_queue)
+        Args:
+            marks: (视频路径, 状态, 源文件大小, 内容指纹) 列表，状态为 "done" 或 "failed"
+        """
+        if not marks:
+            return
         
-        self.save_state()
-        if removed > 0:
-            self.save_queue()
+        now = time.time()
+        with self._transaction() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO processed (path, status, processed_time, size, fingerprint) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(path, status, now, size, fingerprint) for path, status, size, fingerprint in marks]
+            )
+            db.executemany("DELETE FROM queue WHERE path = ?", [(mark[0],) for mark in marks])
         
-        self.logger.warning(f"标记为失败: {video_path}")
+        failed = sum(1 for mark in marks if mark[1] == "failed")
+        self.logger.info(f"批量标记: {len(marks) - failed} 个已处理, {failed} 个失败")
     
     def initialize_from_existing(self):
         """从现有仓库初始化队列"""
         self.logger.info("开始从现有仓库初始化队列...")
         
         all_videos = self.get_all_videos_from_repo()
+        if all_videos is None:
+            self.logger.warning("获取仓库文件清单失败，暂不初始化队列")
+            return False
         
         new_count = 0
-        for video_info in all_videos:
-            if video_info["path"] not in self.processed_videos:
-                self.add_video_to_queue(video_info)
-                new_count += 1
+        with self._transaction():
+            for video_info in all_videos:
+                if self.add_video_to_queue(video_info):
+                    new_count += 1
         
-        self.save_queue()
         self.logger.info(f"初始化完成，添加了 {new_count} 个新视频到队列")
-        self.logger.info(f"当前队列: {len(self.video_queue)} 个待处理视频")
+        self.logger.info(f"当前队列: {self.get_queue_status()['queue_size']} 个待处理视频")
         
         return new_count > 0
     
@@ -321,23 +449,18 @@ class SimpleVideoMonitor:
         """执行一次监控检查"""
         try:
             current_videos = self.get_all_videos_from_repo()
+            if current_videos is None:
+                self.logger.warning("获取仓库文件清单失败，跳过本次检查")
+                return 0
+            
             new_count = 0
             
-            for video_info in current_videos:
-                if video_info["path"] not in self.processed_videos:
-                    # 检查是否是新视频
-                    is_new = True
-                    for item in self.video_queue:
-                        if item["path"] == video_info["path"]:
-                            is_new = False
-                            break
-                    
-                    if is_new:
-                        self.add_video_to_queue(video_info)
+            with self._transaction():
+                for video_info in current_videos:
+                    if self.add_video_to_queue(video_info):
                         new_count += 1
             
             if new_count > 0:
-                self.save_queue()
                 self.logger.info(f"发现 {new_count} 个新视频")
             
             return new_count
@@ -361,20 +484,87 @@ class SimpleVideoMonitor:
         except Exception as e:
             self.logger.error(f"监控异常: {e}")
     
-    def get_next_video(self) -> Optional[Dict]:
+    def get_next_batch(self, limit: int, timeout: Optional[float] = None) -> List[Dict]:
+        """
+        获取接下来最多limit个要处理的视频，并在队列中标记为处理中
+        
+        视频在处理结果写入（mark_batch 等）之前一直留在队列中，
+        监控扫描期间不会把处理中的视频重复加入队列
+        
+        Args:
+            limit: 最多取出的视频数
+            timeout: 队列为空时最多等待新视频入队的秒数，为None时不等待
+            
+        Returns:
+            List[Dict]: 取出的视频，超时或被唤醒时仍无视频则为空列表
+        """
+        with self._queue_cond:
+            batch = self._take_batch(limit)
+            if not batch and timeout:
+                # 其他进程写入的视频不会触发通知，超时后由调用方重新获取
+                self._queue_cond.wait(timeout)
+                batch = self._take_batch(limit)
+        
+        for video in batch:
+            self.logger.debug(f"从队列中取出视频: {video['path']}")
+        return batch
+    
+    def _take_batch(self, limit: int) -> List[Dict]:
+        """在一个事务中读取队首最多limit个待处理视频并标记为处理中"""
+        with self._transaction() as db:
+            rows = db.execute(
+                f"SELECT {self._QUEUE_COLUMNS} FROM queue WHERE status = 'pending' "
+                "ORDER BY added_time, rowid LIMIT ?",
+                (limit,)
+            ).fetchall()
+            db.executemany(
+                "UPDATE queue SET status = 'processing' WHERE path = ?",
+                [(row["path"],) for row in rows]
+            )
+        return [dict(row) for row in rows]
+    
+    def release_video(self, video_path: str):
+        """把处理中的视频放回待处理状态（工作器停止时未完成的视频）"""
+        with self._queue_cond:
+            self._db.execute(
+                "UPDATE queue SET status = 'pending' WHERE path = ? AND status = 'processing'",
+                (video_path,)
+            )
+            self._queue_cond.notify_all()
+    
+    def reset_processing(self) -> int:
+        """工作器启动时把上次遗留的处理中视频放回待处理状态，返回重置的数量"""
+        with self._lock:
+            count = self._db.execute(
+                "UPDATE queue SET status = 'pending' WHERE status = 'processing'"
+            ).rowcount
+        if count:
+            self.logger.info(f"🔄 重置 {count} 个上次未完成的视频为待处理")
+        return count
+    
+    def get_next_video(self, timeout: Optional[float] = None) -> Optional[Dict]:
         """获取下一个要处理的视频并从队列中移除"""
-        if self.video_queue:
-            # 获取并移除队列中的第一个视频
-            next_video = self.video_queue.pop(0)
-            self.save_queue()  # 立即保存队列状态
-            self.logger.debug(f"从队列中取出视频: {next_video['path']}")
-            return next_video
-        return None
+        batch = self.get_next_batch(1, timeout)
+        return batch[0] if batch else None
+    
+    def wake_waiters(self):
+        """唤醒所有等待新视频的消费者（用于停止时让其尽快返回）"""
+        with self._queue_cond:
+            self._queue_cond.notify_all()
     
     def get_queue_status(self) -> Dict:
         """获取队列状态"""
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM queue GROUP BY status").fetchall())
+            processed_count = self._db.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+            next_videos = self._db.execute(
+                f"SELECT {self._QUEUE_COLUMNS} FROM queue WHERE status = 'pending' "
+                "ORDER BY added_time, rowid LIMIT 5"  # 显示前5个
+            ).fetchall()
+        
         return {
-            "queue_size": len(self.video_queue),
-            "processed_count": len(self.processed_videos),
-            "next_videos": self.video_queue[:5]  # 显示前5个
-        } 
\ No newline at end of file
+            "queue_size": counts.get("pending", 0),
+            "processing_count": counts.get("processing", 0),
+            "processed_count": processed_count,
+            "next_videos": [dict(row) for row in next_videos]
+        }
@@ -7,10 +7,16 @@
 
 import os
 import sys
+import glob
+import itertools
+import collections
 import time
+import queue
+import shutil
 import tempfile
+import threading
 import subprocess
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 from pathlib import Path
 
 # 添加项目根目录到Python路径
@@ -18,16 +24,37 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 from config.config import Config
-from src.utils import setup_logging
+from src.utils import setup_logging, fast_fingerprint, check_free_space, low_priority_cmd
 from src.simple_processor import SimpleVideoProcessor
 from src.modelscope_manager import ModelScopeManager
 from tools.simple_monitor import SimpleVideoMonitor
 
+try:
+    from modelscope.hub.file_download import dataset_file_download
+    from modelscope.hub.snapshot_download import dataset_snapshot_download
+    from requests.adapters import HTTPAdapter
+    MODELSCOPE_AVAILABLE = True
+except ImportError:
+    MODELSCOPE_AVAILABLE = False
+
 
 class SimpleVideoWorker:
     """简化的视频处理工作器"""
     
-    def __init__(self):
+    # 流水线阶段之间的队列容量
+    PIPELINE_QUEUE_SIZE = 2
+    # 队列为空时等待新视频入队的最长时间（秒）
+    IDLE_WAIT_SECONDS = 30
+    # 批量写入处理状态的间隔（秒）
+    MARK_FLUSH_SECONDS = 5
+    # CLI失败时在日志中保留的输出行数
+    CLI_OUTPUT_TAIL_LINES = 20
+    
+    def __init__(self, monitor: Optional[SimpleVideoMonitor] = None):
+        """
+        Args:
+            monitor: 共享的监控器，与其在同一进程中入队的视频会立即唤醒工作器；为None时自行创建
+        """
         self.config = Config()
         self.logger = setup_logging('video_worker')
 
@@ -35,147 +62,244 @@ class SimpleVideoWorker:
         self.video_processor = SimpleVideoProcessor(setup_logging('video_processor'))
         # ModelScope管理器需要token参数
         self.modelscope_manager = ModelScopeManager(self.config.MODELSCOPE_TOKEN)
-        self.monitor = SimpleVideoMonitor()
-
-        # 工作目录
-        self.temp_dir = tempfile.mkdtemp(prefix="simple_video_")
-        self.logger.info(f"工作目录: {self.temp_dir}")
+        self.monitor = monitor or SimpleVideoMonitor()
 
         # 仓库配置
         self.input_repo_id = self.config.INPUT_REPO_ID   # 下载用
         self.output_repo_id = self.config.OUTPUT_REPO_ID  # 上传用
         
-        # 确保ModelScope CLI已登录
-        self._ensure_modelscope_login()
+        # 每批从队列取出并一次性下载的视频数量
+        self.download_batch_size = getattr(self.config, 'DOWNLOAD_BATCH_SIZE', 4)
+        
+        # 下载、上传阶段各自的并发线程数（网络传输可并行）
+        self.max_workers = max(1, getattr(self.config, 'MAX_WORKERS', 3))
+        
+        # 工作目录（空间足够时放在内存文件系统上，减少中间文件的磁盘读写）
+        self.temp_dir = tempfile.mkdtemp(prefix="simple_video_", dir=self._pick_temp_root())
+        # 临时文件序号，保证同时处理的视频使用不同的本地文件名
+        self._temp_seq = itertools.count(1)
+        self.logger.info(f"工作目录: {self.temp_dir}")
+        
+        # 连接池需容纳所有并发传输线程，使各线程复用已建立的TLS连接
+        self._tune_api_session(self.modelscope_manager.api, 2 * self.max_workers + 2)
+        
+        # 流水线停止信号
+        self._stop_event = threading.Event()
+        
+        # 待写入监控数据库的处理结果，由后台线程定期批量写入
+        self._pending_marks: List[Tuple[str, str, Optional[int], Optional[str]]] = []
+        self._marks_lock = threading.Lock()
+        
+        # ModelScopeManager 登录时已把凭证写入 ~/.modelscope/credentials，CLI 子进程直接复用；
+        # 环境变量供未传token的SDK调用及子进程使用，无需再启动 modelscope login
+        os.environ['MODELSCOPE_API_TOKEN'] = self.config.MODELSCOPE_TOKEN
+    
+    def _max_files_in_flight(self) -> int:
+        """流水线同时驻留在临时目录中的视频文件数上限"""
+        return (
+            self.PIPELINE_QUEUE_SIZE    # 下载名额：正在下载、等待转换和正在转换的输入
+            + 1                         # 正在转换的输出
+            + self.PIPELINE_QUEUE_SIZE  # 等待上传
+            + self.max_workers          # 正在上传
+        )
+    
+    def _pick_temp_root(self) -> Optional[str]:
+        """
+        选择能容纳流水线全部中间文件的tmpfs目录，空间不足或不可用时返回None（使用系统默认临时目录）
+        
+        tmpfs 占用的是内存，只在按最坏情况估算也放得下时使用，避免写满内存
+        """
+        max_video_size_gb = getattr(self.config, 'MAX_VIDEO_SIZE_GB', 5)
+        min_free_gb = self._max_files_in_flight() * max_video_size_gb
+        for root in ("/dev/shm", f"/run/user/{os.getuid()}" if hasattr(os, 'getuid') else None):
+            if not root or not os.path.isdir(root) or not os.access(root, os.W_OK):
+                continue
+            try:
+                if check_free_space(root, min_free_gb):
+                    return root
+            except OSError:
+                continue
+        
+        self.logger.info(f"内存文件系统剩余空间不足 {min_free_gb} GB，使用磁盘临时目录")
+        return None
+    
+    def _tune_api_session(self, api, pool_size: int):
+        """扩大SDK会话的连接池，保留SDK原有的重试策略"""
+        session = getattr(api, 'session', None)
+        if not MODELSCOPE_AVAILABLE or session is None:
+            return
+        
+        try:
+            retries = session.get_adapter('https://').max_retries
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        except Exception as e:
+            self.logger.warning(f"调整SDK连接池失败: {e}")
     
-    def process_single_video(self, video_info: Dict) -> bool:
+    def _download_batch(self, video_paths: List[str]) -> Dict[str, str]:
         """
-        处理单个视频的完整流程
+        通过一次SDK调用批量下载多个视频，摊薄每次下载的清单获取和认证开销
         
         Args:
-            video_info: 视频信息字典
+            video_paths: 仓库中的视频路径列表
             
         Returns:
-            bool: 处理是否成功
+            Dict[str, str]: 仓库路径 -> 本地路径的映射，未下载成功的视频不在其中
         """
-        video_path = video_info["path"]
-        self.logger.info(f"开始处理视频: {video_path}")
-        
-        local_input_path = None
-        local_output_path = None
+        downloaded = {}
+        if not MODELSCOPE_AVAILABLE or not video_paths:
+            return downloaded
         
+        batch_dir = tempfile.mkdtemp(dir=self.temp_dir, prefix="batch_")
         try:
-            # 步骤1: 下载视频文件
-            self.logger.info(f"步骤1: 下载视频文件...")
-            local_input_path = self._download_single_video(video_path)
-            if not local_input_path:
-                self.logger.error(f"下载失败: {video_path}")
-                return False
-            
-            # 步骤2: 转换为MKV+AV1
-            self.logger.info(f"步骤2: 转换视频格式...")
-            local_output_path = self._convert_video(local_input_path)
-            if not local_output_path:
-                self.logger.error(f"转换失败: {video_path}")
-                return False
+            self.logger.info(f"批量下载 {len(video_paths)} 个视频...")
             
-            # 步骤3: 上传转换后的文件
-            self.logger.info(f"步骤3: 上传转换后的文件...")
-            output_repo_path = self._get_output_repo_path(video_path)
-            if not self._upload_converted_video(local_output_path, output_repo_path):
-                self.logger.error(f"上传失败: {video_path}")
-                return False
+            # 文件名中的 [] 等字符在匹配模式中有特殊含义，需要转义
+            dataset_snapshot_download(
+                self.input_repo_id,
+                local_dir=batch_dir,
+                allow_file_pattern=[glob.escape(path) for path in video_paths]
+            )
             
-            # 步骤4: 标记为已处理
-            self.monitor.mark_video_processed(video_path)
+            # 下载目录保留仓库中的相对路径，直接移动到期望的文件名
+            for video_path in video_paths:
+                downloaded_path = os.path.join(batch_dir, video_path)
+                if os.path.exists(downloaded_path):
+                    final_path = self._temp_path("input", os.path.basename(video_path))
+                    self._move_into_place(downloaded_path, final_path)
+                    downloaded[video_path] = final_path
             
-            self.logger.info(f"视频处理完成: {video_path} → {output_repo_path}")
-            return True
+            self.logger.info(f"批量下载完成: {len(downloaded)}/{len(video_paths)}")
             
         except Exception as e:
-            self.logger.error(f"处理视频异常 {video_path}: {e}")
-            return False
+            self.logger.error(f"批量下载失败，将逐个下载: {e}")
         
         finally:
-            # 清理临时文件
-            self._cleanup_temp_files(local_input_path, local_output_path)
+            shutil.rmtree(batch_dir, ignore_errors=True)
+        
+        return downloaded
+    
+    def _temp_path(self, kind: str, filename: str) -> str:
+        """
+        生成临时文件路径，带递增序号
+        
+        多个视频同时在临时目录中处理，不同目录下的同名视频（如 A/ep01.mp4 与 B/ep01.mp4）
+        必须使用不同的本地文件
+        """
+        return os.path.join(self.temp_dir, f"{kind}_{next(self._temp_seq)}_{filename}")
+    
+    @staticmethod
+    def _move_into_place(src: str, dst: str):
+        """移动下载结果：同一文件系统内直接重命名，跨文件系统时退回复制+删除"""
+        try:
+            os.replace(src, dst)
+        except OSError:
+            shutil.move(src, dst)
     
     def _download_single_video(self, video_path: str) -> Optional[str]:
         """下载单个视频文件"""
+        # 每次下载使用独立的子目录，下载结果位于已知路径，无需遍历临时目录查找
+        dl_dir = tempfile.mkdtemp(dir=self.temp_dir, prefix="dl_")
         try:
             # 构造本地文件名
             filename = os.path.basename(video_path)
-            local_path = os.path.join(self.temp_dir, f"input_{filename}")
+            final_path = self._temp_path("input", filename)
+            
+            # 方案1: 进程内SDK下载
+            downloaded_path = self._download_via_sdk(video_path, dl_dir)
+            
+            # 方案2: SDK失败时使用CLI下载
+            if not downloaded_path:
+                self.logger.warning("🔄 SDK下载失败，尝试CLI下载...")
+                downloaded_path = self._download_via_cli(video_path, dl_dir)
             
+            if not downloaded_path:
+                return None
+            
+            # 重命名为期望的文件名
+            self._move_into_place(downloaded_path, final_path)
+            
+            file_size = os.path.getsize(final_path)
+            self.logger.info(f"下载成功: {filename} ({file_size // 1024 // 1024} MB)")
+            return final_path
+                
+        except Exception as e:
+            self.logger.error(f"下载异常: {e}")
+            return None
+        
+        finally:
+            shutil.rmtree(dl_dir, ignore_errors=True)
+    
+    def _download_via_sdk(self, video_path: str, dl_dir: str) -> Optional[str]:
+        """通过SDK下载到 dl_dir，返回下载到的本地路径"""
+        if not MODELSCOPE_AVAILABLE:
+            return None
+        
+        try:
+            # 复用已登录的进程内会话，无需启动CLI进程
+            return dataset_file_download(
+                self.input_repo_id,
+                video_path,
+                local_dir=dl_dir
+            )
+        except Exception as e:
+            self.logger.error(f"❌ SDK下载失败: {e}")
+            return None
+    
+    def _download_via_cli(self, video_path: str, dl_dir: str) -> Optional[str]:
+        """通过CLI下载到 dl_dir，返回下载到的本地路径"""
+        try:
             # 使用正确的ModelScope CLI下载命令格式
             cmd = [
                 "modelscope", "download",
                 self.input_repo_id,             # repo_id (位置参数)
                 "--repo-type", "dataset",       # 指定为数据集仓库
-                "--local_dir", self.temp_dir,   # 本地目录
-                "--include", video_path,        # 只下载指定文件
-                "--token", self.config.MODELSCOPE_TOKEN  # 明确指定token
+                "--local_dir", dl_dir,          # 本地目录
+                "--include", video_path         # 只下载指定文件
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=1800)  # 30分钟超时
-            
-            if result.returncode == 0:
-                # 查找下载的文件
-                for root, dirs, files in os.walk(self.temp_dir):
-                    for file in files:
-                        if file == filename or file.endswith(filename):
-                            downloaded_path = os.path.join(root, file)
-                            # 重命名为期望的文件名
-                            final_path = os.path.join(self.temp_dir, f"input_{filename}")
-                            if downloaded_path != final_path:
-                                import shutil
-                                shutil.move(downloaded_path, final_path)
-                            
-                            file_size = os.path.getsize(final_path)
-                            self.logger.info(f"下载成功: {filename} ({file_size // 1024 // 1024} MB)")
-                            return final_path
-                
-                self.logger.error(f"下载完成但未找到文件: {filename}")
-                return None
-            else:
-                self.logger.error(f"下载失败: {result.stderr}")
+            returncode, output = self._run_cli(cmd, timeout=1800)  # 30分钟超时
+            
+            if returncode != 0:
+                self.logger.error(f"下载失败: {output}")
                 return None
+            
+            # --local_dir 下载会保留仓库中的相对路径
+            downloaded_path = os.path.join(dl_dir, video_path)
+            if os.path.isfile(downloaded_path):
+                return downloaded_path
+            
+            self.logger.error(f"下载完成但未找到文件: {video_path}")
+            return None
                 
         except Exception as e:
-            self.logger.error(f"下载异常: {e}")
+            self.logger.error(f"CLI下载异常: {e}")
             return None
     
-    def _convert_video(self, input_path: str) -> Optional[str]:
+    def _output_names(self, video_path: str) -> Tuple[str, str]:
+        """返回输出文件在仓库中的目录和文件名（保持目录结构，只改变扩展名）"""
+        output_filename = self.video_processor.get_output_filename(os.path.basename(video_path))
+        return os.path.dirname(video_path), output_filename
+    
+    def _convert_video(self, input_path: str, output_filename: str) -> Optional[str]:
         """转换视频格式"""
         try:
-            # 生成输出文件名 - 从原始文件名获取，不是从本地文件名
-            original_filename = os.path.basename(input_path)
-            # 去掉input_前缀
-            if original_filename.startswith("input_"):
-                original_filename = original_filename[6:]  # 去掉"input_"
-            
-            output_filename = self.video_processor.get_output_filename(original_filename)
-            output_path = os.path.join(self.temp_dir, f"output_{output_filename}")
+            output_path = self._temp_path("output", output_filename)
             
             # 执行转换
-            if self.video_processor.convert_to_mkv_av1(input_path, output_path):
-                return output_path
-            else:
-                return None
+            converted = self.video_processor.convert_to_mkv_av1(input_path, output_path)
+            return output_path if converted else None
                 
         except Exception as e:
             self.logger.error(f"转换异常: {e}")
             return None
     
-    def _get_output_repo_path(self, input_video_path: str) -> str:
+    @staticmethod
+    def _get_output_repo_path(output_dir: str, output_filename: str) -> str:
         """生成输出文件的仓库路径"""
-        # 保持目录结构，只改变文件扩展名
-        directory = os.path.dirname(input_video_path)
-        filename = os.path.basename(input_video_path)
-        output_filename = self.video_processor.get_output_filename(filename)
-        
-        if directory:
-            return f"{directory}/{output_filename}"
+        if output_dir:
+            return f"{output_dir}/{output_filename}"
         else:
             return output_filename
     
@@ -187,21 +311,22 @@ class SimpleVideoWorker:
             self.logger.info(f"  目标仓库: {self.output_repo_id}")
             self.logger.info(f"  目标路径: {repo_path}")
             
-            # 检查本地文件
-            if not os.path.exists(local_path):
+            # 检查本地文件（一次 stat 同时取得大小）
+            try:
+                file_size = os.stat(local_path).st_size
+            except FileNotFoundError:
                 self.logger.error(f"本地文件不存在: {local_path}")
                 return False
-                
-            file_size = os.path.getsize(local_path)
+            
             self.logger.info(f"  文件大小: {file_size // 1024 // 1024} MB")
             
-            # 方案1: 尝试CLI上传
-            if self._upload_via_cli(local_path, repo_path, file_size):
+            # 方案1: 进程内SDK上传，复用已登录的会话
+            if self._upload_via_sdk(local_path, repo_path, file_size):
                 return True
             
-            # 方案2: CLI失败时使用SDK上传
-            self.logger.warning("🔄 CLI上传失败，尝试SDK上传...")
-            return self._upload_via_sdk(local_path, repo_path, file_size)
+            # 方案2: SDK失败时使用CLI上传
+            self.logger.warning("🔄 SDK上传失败，尝试CLI上传...")
+            return self._upload_via_cli(local_path, repo_path, file_size)
                 
         except Exception as e:
             self.logger.error(f"💥 上传流程异常: {e}")
@@ -217,25 +342,21 @@ class SimpleVideoWorker:
                 local_path,                 # local_path (位置参数)
                 repo_path,                  # path_in_repo (位置参数)
                 "--repo-type", "dataset",   # 指定为数据集仓库
-                "--commit-message", f"Upload converted video: {os.path.basename(repo_path)}",
-                "--token", self.config.MODELSCOPE_TOKEN  # 明确指定token
+                "--commit-message", f"Upload converted video: {os.path.basename(repo_path)}"
             ]
             
             self.logger.info(f"🚀 CLI上传命令: {' '.join(cmd)}")
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=1800)
+            returncode, output = self._run_cli(cmd, timeout=1800)
             
-            self.logger.info(f"命令返回码: {result.returncode}")
-            if result.stdout:
-                self.logger.info(f"命令输出: {result.stdout}")
-            if result.stderr:
-                self.logger.error(f"命令错误: {result.stderr}")
+            self.logger.info(f"命令返回码: {returncode}")
             
-            if result.returncode == 0:
+            if returncode == 0:
                 self.logger.info(f"✅ CLI上传成功: {repo_path} ({file_size // 1024 // 1024} MB)")
                 return True
             else:
-                self.logger.error(f"❌ CLI上传失败，返回码: {result.returncode}")
+                self.logger.error(f"❌ CLI上传失败，返回码: {returncode}")
+                self.logger.error(f"命令输出: {output}")
                 return False
                 
         except subprocess.TimeoutExpired:
@@ -245,6 +366,46 @@ class SimpleVideoWorker:
             self.logger.error(f"💥 CLI上传异常: {e}")
             return False
     
+    def _run_cli(self, cmd: List[str], timeout: int) -> Tuple[int, str]:
+        """
+        运行ModelScope CLI，逐行读取输出，避免长时间传输时在内存中累积全部输出
+        
+        Returns:
+            Tuple[int, str]: 返回码和最后若干行输出（用于报错）
+            
+        Raises:
+            subprocess.TimeoutExpired: 超时（子进程已被终止）
+        """
+        # 关闭tqdm进度条，避免输出大量进度行
+        env = dict(os.environ, TQDM_DISABLE='1')
+        proc = subprocess.Popen(low_priority_cmd(cmd), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, bufsize=1, env=env)
+        tail = collections.deque(maxlen=self.CLI_OUTPUT_TAIL_LINES)
+        
+        def drain():
+            for line in proc.stdout:
+                line = line.rstrip()
+                if line:
+                    # 进度刷新也会产生大量行，只在调试日志中输出；失败时由调用方记录最后若干行
+                    tail.append(line)
+                    self.logger.debug(line)
+        
+        reader = threading.Thread(target=drain, daemon=True)
+        reader.start()
+        try:
+            returncode = proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            # 子进程退出时管道中可能还有未读完的输出（通常是错误信息），读到EOF后再汇总
+            reader.join(timeout=5)
+            # 管道仍被残留的子进程占用时读取线程还在运行，不能关闭，留给读取线程读到EOF后回收
+            if not reader.is_alive():
+                proc.stdout.close()
+        return returncode, '\n'.join(list(tail))
+    
     def _upload_via_sdk(self, local_path: str, repo_path: str, file_size: int) -> bool:
         """通过SDK上传"""
         try:
@@ -268,76 +429,298 @@ class SimpleVideoWorker:
             return False
     
     def _cleanup_temp_files(self, *file_paths):
-        """清理临时文件"""
-        for file_path in file_paths:
-            if file_path and os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    self.logger.debug(f"清理文件: {os.path.basename(file_path)}")
-                except Exception as e:
-                    self.logger.warning(f"清理失败 {file_path}: {e}")
-    
-    def _ensure_modelscope_login(self):
-        """确保ModelScope CLI已登录"""
+        """清理临时文件（忽略None和重复路径）"""
+        for file_path in set(filter(None, file_paths)):
+            try:
+                Path(file_path).unlink(missing_ok=True)
+                self.logger.debug(f"清理文件: {os.path.basename(file_path)}")
+            except OSError as e:
+                self.logger.warning(f"清理失败 {file_path}: {e}")
+    
+    def _put(self, stage_queue: queue.Queue, item) -> bool:
+        """把任务交给下一阶段，下游繁忙时阻塞等待，停止时放弃并返回False"""
+        while not self._stop_event.is_set():
+            try:
+                stage_queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _get(self, stage_queue: queue.Queue):
+        """从上一阶段取出任务，停止时返回None"""
+        while not self._stop_event.is_set():
+            try:
+                return stage_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+        return None
+    
+    def _handle_failure(self, video_info: Dict, *file_paths):
+        """处理失败的视频：停止过程中中断的放回队列，否则标记为失败"""
+        video_path = video_info['path']
+        if self._stop_event.is_set():
+            self.monitor.release_video(video_path)
+        else:
+            self.logger.error(f"❌ 处理失败: {video_path}")
+            # 标记为失败，避免重复处理
+            self._queue_mark(video_info, "failed")
+        self._cleanup_temp_files(*file_paths)
+    
+    def _acquire_download_slots(self) -> int:
+        """
+        获取下载名额：阻塞等待至少一个，再尽量多取（不超过一批的大小），停止时返回0
+        
+        每个名额对应一个视频，在其转换结束、输入文件删除后由转换阶段归还
+        """
+        while not self._stop_event.is_set():
+            if self._download_slots.acquire(timeout=1):
+                break
+        else:
+            return 0
+        
+        slots = 1
+        while slots < self.download_batch_size and self._download_slots.acquire(blocking=False):
+            slots += 1
+        return slots
+    
+    def _release_download_slots(self, count: int = 1):
+        """归还下载名额"""
+        for _ in range(count):
+            self._download_slots.release()
+    
+    def _download_stage(self, convert_queue: queue.Queue):
+        """流水线第1段：从队列批量取出视频并下载"""
+        while not self._stop_event.is_set():
+            slots = self._acquire_download_slots()
+            if not slots:
+                return
+            
+            # 获取下一批视频（会自动从队列中移除），队列为空时阻塞等待新视频入队
+            batch = self.monitor.get_next_batch(slots, timeout=self.IDLE_WAIT_SECONDS)
+            self._release_download_slots(slots - len(batch))
+            if not batch:
+                self.logger.info("📪 队列为空，等待新视频...")
+                continue
+            
+            downloaded = self._download_batch([video['path'] for video in batch])
+            
+            for video_info in batch:
+                video_path = video_info['path']
+                local_input_path = downloaded.get(video_path)
+                
+                if self._stop_event.is_set():
+                    self._handle_failure(video_info, local_input_path)
+                    self._release_download_slots()
+                    continue
+                
+                # 批量下载未取到时单独下载
+                if not local_input_path:
+                    local_input_path = self._download_single_video(video_path)
+                if not local_input_path:
+                    self.logger.error(f"下载失败: {video_path}")
+                    self._handle_failure(video_info)
+                    self._release_download_slots()
+                    continue
+                
+                if not self._put(convert_queue, (video_info, local_input_path)):
+                    self._handle_failure(video_info, local_input_path)
+                    self._release_download_slots()
+    
+    def _record_fingerprint(self, video_info: Dict, local_input_path: str):
+        """
+        记录源文件的内容指纹，失败时不影响处理流程
+        
+        video_info 中的大小保持为仓库清单中的值，监控器用同一来源的大小判断文件是否被替换
+        """
         try:
-            self.logger.info("检查ModelScope CLI登录状态...")
-            # ModelScopeManager初始化时已经登录，这里通过CLI命令确认
-            result = subprocess.run(
-                ["modelscope", "login", "--token", self.config.MODELSCOPE_TOKEN],
-                capture_output=True, text=True, timeout=30
-            )
-            if result.returncode == 0:
-                self.logger.info("✅ ModelScope CLI已登录")
+            video_info['fingerprint'] = fast_fingerprint(local_input_path)
+        except OSError as e:
+            self.logger.warning(f"计算文件指纹失败 {local_input_path}: {e}")
+    
+    def _already_converted(self, video_info: Dict) -> bool:
+        """
+        因清单中的文件大小变化而重新入队的视频，若内容指纹与上次成功处理时相同则无需再次转换
+        
+        跳过时仍会记录新的清单大小，下一轮扫描不会再次入队
+        """
+        fingerprint = video_info.get('fingerprint')
+        if not fingerprint:
+            return False
+        try:
+            if self.monitor.get_processed_fingerprint(video_info['path']) != fingerprint:
+                return False
+        except Exception as e:
+            self.logger.warning(f"查询处理记录失败 {video_info['path']}: {e}")
+            return False
+        self.logger.info(f"⏭️ 文件内容与上次处理时相同，跳过转换: {video_info['path']}")
+        return True
+    
+    def _convert_stage(self, convert_queue: queue.Queue, upload_queue: queue.Queue):
+        """流水线第2段：转换视频格式"""
+        while True:
+            item = self._get(convert_queue)
+            if item is None:
+                return
+            
+            video_info, local_input_path = item
+            video_path = video_info['path']
+            self.logger.info(f"🎬 开始转换: {video_path}")
+            
+            # 输入文件转换后即被删除，需在此之前计算指纹
+            self._record_fingerprint(video_info, local_input_path)
+            if self._already_converted(video_info):
+                self._cleanup_temp_files(local_input_path)
+                self._release_download_slots()
+                self._queue_mark(video_info, "done")
+                continue
+            
+            # 输出路径只在此推导一次，随转换结果交给上传阶段
+            output_dir, output_filename = self._output_names(video_path)
+            output_repo_path = self._get_output_repo_path(output_dir, output_filename)
+            local_output_path = self._convert_video(local_input_path, output_filename)
+            # 转换结束后输入文件不再需要，尽早释放临时空间，并允许下载下一个视频
+            self._cleanup_temp_files(local_input_path)
+            self._release_download_slots()
+            
+            if not local_output_path:
+                self.logger.error(f"转换失败: {video_path}")
+                self._handle_failure(video_info)
+                continue
+            
+            if not self._put(upload_queue, (video_info, local_output_path, output_repo_path)):
+                self._handle_failure(video_info, local_output_path)
+    
+    def _upload_stage(self, upload_queue: queue.Queue):
+        """流水线第3段：上传转换结果并标记为已处理"""
+        while True:
+            item = self._get(upload_queue)
+            if item is None:
+                return
+            
+            video_info, local_output_path, output_repo_path = item
+            video_path = video_info['path']
+            
+            if self._upload_converted_video(local_output_path, output_repo_path):
+                self._queue_mark(video_info, "done")
+                self._cleanup_temp_files(local_output_path)
+                self.logger.info(f"✅ 处理成功: {video_path} → {output_repo_path}")
             else:
-                self.logger.warning(f"CLI登录警告: {result.stderr}")
-                self.logger.info("继续使用SDK登录...")
+                self.logger.error(f"上传失败: {video_path}")
+                self._handle_failure(video_info, local_output_path)
+            
+            # 显示进度状态
+            status = self.monitor.get_queue_status()
+            self.logger.info(f"📊 进度: {status['processed_count']} 已完成, {status['queue_size']} 待处理")
+    
+    def _queue_mark(self, video_info: Dict, status: str):
+        """记录处理结果，等待后台线程批量写入"""
+        with self._marks_lock:
+            self._pending_marks.append(
+                (video_info['path'], status, video_info.get('size'), video_info.get('fingerprint'))
+            )
+    
+    def _flush_marks(self):
+        """把积累的处理结果一次性写入监控数据库，失败时保留到下次重试"""
+        with self._marks_lock:
+            marks, self._pending_marks = self._pending_marks, []
+        if not marks:
+            return
+        
+        try:
+            self.monitor.mark_batch(marks)
         except Exception as e:
-            self.logger.warning(f"CLI登录检查失败: {e}")
-            self.logger.info("继续使用SDK登录...")
+            self.logger.error(f"写入处理状态失败: {e}")
+            with self._marks_lock:
+                self._pending_marks[:0] = marks
+    
+    def _flush_marks_loop(self):
+        """后台线程：定期批量写入处理结果，停止时立即写入一次，剩余结果由主线程最后写入"""
+        while not self._stop_event.wait(self.MARK_FLUSH_SECONDS):
+            self._flush_marks()
+        self._flush_marks()
+    
+    def _requeue_pending(self, stage_queue: queue.Queue):
+        """把阶段队列中尚未处理的视频放回监控队列"""
+        while True:
+            try:
+                video_info = stage_queue.get_nowait()[0]
+            except queue.Empty:
+                return
+            self.monitor.release_video(video_info['path'])
+    
+    def stop(self):
+        """通知流水线各阶段停止"""
+        self._stop_event.set()
+        self.monitor.wake_waiters()
     
     def run_worker(self):
-        """运行工作器 - 持续处理队列中的视频"""
-        self.logger.info("启动视频处理工作器...")
+        """运行工作器 - 以 下载→转换→上传 三段流水线持续处理队列中的视频"""
+        self.logger.info(f"启动视频处理工作器（并发传输数: {self.max_workers}）...")
+        
+        self._stop_event.clear()
+        # 上次异常退出时遗留的处理中视频重新排队
+        self.monitor.reset_processing()
+        
+        # 阶段之间使用有界队列，下载阶段另受下载名额限制，控制同时驻留在临时目录中的视频数量，
+        # 使下一个视频的下载、当前视频的转换和上一个视频的上传可以同时进行
+        convert_queue = queue.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+        upload_queue = queue.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+        # 已下载（或正在下载）但尚未转换完成的视频名额；转换是瓶颈，提前下载过多只会占满临时空间
+        self._download_slots = threading.BoundedSemaphore(self.PIPELINE_QUEUE_SIZE)
+        
+        # 下载和上传受网络带宽和延迟限制，各开 max_workers 个线程并发传输（下载另受下载名额限制）；
+        # 转换只用一个线程，av1_nvenc 编码器是独占资源，单线程即保证同一时间只有一个编码任务
+        stages = [
+            threading.Thread(target=self._download_stage, args=(convert_queue,),
+                             name=f"download_stage_{i}", daemon=True)
+            for i in range(self.max_workers)
+        ]
+        stages.append(threading.Thread(target=self._convert_stage, args=(convert_queue, upload_queue),
+                                       name="convert_stage", daemon=True))
+        stages.extend(
+            threading.Thread(target=self._upload_stage, args=(upload_queue,),
+                             name=f"upload_stage_{i}", daemon=True)
+            for i in range(self.max_workers)
+        )
+        flusher = threading.Thread(target=self._flush_marks_loop, name="mark_flusher", daemon=True)
         
         try:
-            while True:
-                # 获取下一个视频（会自动从队列中移除）
-                next_video = self.monitor.get_next_video()
-                
-                if next_video:
-                    video_path = next_video['path']
-                    self.logger.info(f"🎬 开始处理: {video_path}")
-                    
-                    # 处理视频
-                    success = self.process_single_video(next_video)
-                    
-                    if success:
-                        self.logger.info(f"✅ 处理成功: {video_path}")
-                        # process_single_video内部已经调用了mark_video_processed
-                    else:
-                        self.logger.error(f"❌ 处理失败: {video_path}")
-                        # 标记为失败，避免重复处理
-                        self.monitor.mark_video_failed(video_path)
-                else:
-                    # 队列为空，等待一段时间
-                    self.logger.info("📪 队列为空，等待新视频...")
-                    time.sleep(30)
-                
-                # 显示进度状态
-                status = self.monitor.get_queue_status()
-                self.logger.info(f"📊 进度: {status['processed_count']} 已完成, {status['queue_size']} 待处理")
+            for stage in stages:
+                stage.start()
+            flusher.start()
+            
+            # 主线程等待，任一阶段意外退出或收到停止通知时结束整个流水线
+            while not self._stop_event.is_set() and all(stage.is_alive() for stage in stages):
+                time.sleep(1)
                 
         except KeyboardInterrupt:
-            self.logger.info("🛑 工作器已停止")
+            self.logger.info("🛑 工作器停止中...")
         except Exception as e:
             self.logger.error(f"💥 工作器异常: {e}")
         finally:
+            self.stop()
+            # 先写入已完成视频的结果：等待阶段线程退出可能较久，调用方不一定等到最后
+            self._flush_marks()
+            for stage in stages:
+                if stage.is_alive():
+                    stage.join(timeout=60)
+            
+            # 尚在阶段队列中的视频放回监控队列，下次启动继续处理
+            self._requeue_pending(convert_queue)
+            self._requeue_pending(upload_queue)
+            
+            # 写入剩余的处理结果
+            if flusher.is_alive():
+                flusher.join(timeout=10)
+            self._flush_marks()
+            self.logger.info("🛑 工作器已停止")
+            
             # 清理工作目录
             try:
-                import shutil
                 shutil.rmtree(self.temp_dir)
                 self.logger.info(f"🧹 清理工作目录: {self.temp_dir}")
-            except:
+            except OSError:
                 pass
 
 